@@ -0,0 +1,53 @@
+"""Handshake pieces shared by the blocking client and the asyncio simulator."""
+
+import random
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+
+from . import _raw, _scapy
+
+
+@dataclass(slots=True)
+class DhcpLease:
+    """Captured information returned by the DHCP server."""
+
+    assigned_ip: str
+    server_id: Optional[str]
+    lease_time: Optional[int]
+    subnet_mask: Optional[str]
+    router: Optional[str]
+    dns_servers: List[str]
+    raw_options: Dict[str, object] = field(default_factory=dict)
+
+
+def frame_builders(backend: str):
+    """Return the ``(build_discover, build_request)`` pair for ``backend``."""
+    if backend == "scapy":
+        return _scapy.build_discover, _scapy.build_request
+    if backend == "raw":
+        return _raw.build_discover, _raw.build_request
+    raise ValueError("backend must be either 'scapy' or 'raw'.")
+
+
+def retry_timeout(
+    attempt: int, timeout: float, cutoff: float, jitter: float, rng: random.Random
+) -> float:
+    base = min(cutoff, timeout * (1 << attempt))
+    spread = min(jitter, base / 2)
+    return base + rng.uniform(-spread, spread)
+
+
+def lease_from_options(
+    assigned_ip: str, options: Dict[str, object], include_raw_options: bool = False
+) -> DhcpLease:
+    # parse_reply already decodes addresses to dotted-quad strings.
+    routers = options.get("router")
+    return DhcpLease(
+        assigned_ip=assigned_ip,
+        server_id=options.get("server_id"),
+        lease_time=options.get("lease_time"),
+        subnet_mask=options.get("subnet_mask"),
+        router=routers[0] if routers else None,
+        dns_servers=options.get("name_server") or [],
+        raw_options=options if include_raw_options else {},
+    )
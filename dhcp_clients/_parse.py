@@ -0,0 +1,34 @@
+"""DHCP option TLV scanning."""
+
+from typing import List, Tuple
+
+
+def parse_options(buf, start: int, end: int) -> Tuple[List[int], List[int], List[int]]:
+    """
+    Walk the DHCP options between ``start`` and ``end`` of ``buf``.
+
+    Returns parallel ``(codes, offsets, lengths)`` lists, where each offset
+    points at the first value byte. Pad options are skipped and scanning stops
+    at the end option or at the first truncated TLV.
+    """
+    codes: List[int] = []
+    offsets: List[int] = []
+    lengths: List[int] = []
+    i = start
+    while i < end:
+        code = buf[i]
+        if code == 255:
+            break
+        if code == 0:
+            i += 1
+            continue
+        if i + 1 >= end:
+            break
+        length = buf[i + 1]
+        if i + 2 + length > end:
+            break
+        codes.append(code)
+        offsets.append(i + 2)
+        lengths.append(length)
+        i += 2 + length
+    return codes, offsets, lengths
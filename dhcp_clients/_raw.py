@@ -0,0 +1,205 @@
+"""Scapy-free construction and parsing of DHCP client frames."""
+
+import socket
+import struct
+from typing import Dict, List, Optional, Tuple
+
+from ._parse import parse_options
+
+# subnet mask, router, DNS, lease time, message type, server id
+_LEASE_OPTION_CODES = frozenset((1, 3, 6, 51, 53, 54))
+ETHER_HEADER_LEN = 14
+_ETHERTYPE_IPV4 = 0x0800
+_DHCP_MAGIC_COOKIE = b"\x63\x82\x53\x63"
+# Option 55 (parameter request list): subnet mask, router, DNS, domain name,
+# lease time, server id, renewal (T1) and rebinding (T2) times.
+PARAM_REQ_TLV = bytes([55, 8, 1, 3, 6, 15, 51, 54, 58, 59])
+
+# DHCP message types (option 53).
+DHCPDISCOVER = 1
+DHCPOFFER = 2
+DHCPREQUEST = 3
+DHCPACK = 5
+DHCPNAK = 6
+
+# op, htype, hlen, hops, xid, secs, flags, ciaddr, yiaddr, siaddr, giaddr,
+# chaddr, sname + file, magic cookie
+BOOTP_HEADER = struct.Struct(">BBBBIHH4s4s4s4s16s192s4s")
+# Both frame builders emit a 20-byte IPv4 header without options.
+BOOTP_OFF = ETHER_HEADER_LEN + 20 + 8
+_IPV4_HEADER = struct.Struct(">BBHHHBBH4s4s")
+_UDP_HEADER = struct.Struct(">HHHH")
+
+_BROADCAST_MAC = b"\xff" * 6
+_BROADCAST_ADDR = b"\xff" * 4
+_UNSPECIFIED_ADDR = bytes(4)
+# RFC 1542 relay agents may drop BOOTP messages shorter than this.
+_MIN_BOOTP_LEN = 300
+
+
+def build_discover(mac: bytes, xid: int) -> bytearray:
+    """Build a broadcast DHCPDISCOVER Ethernet frame sent from ``mac``."""
+    return _build_frame(mac, xid, bytes((53, 1, DHCPDISCOVER)))
+
+
+def build_request(
+    mac: bytes, xid: int, requested_ip: str, server_id: Optional[str]
+) -> bytearray:
+    """
+    Build a broadcast DHCPREQUEST Ethernet frame for ``requested_ip``.
+
+    The server identifier option is only included when ``server_id`` is set.
+    """
+    options = bytes((53, 1, DHCPREQUEST, 50, 4)) + socket.inet_aton(requested_ip)
+    if server_id:
+        options += bytes((54, 4)) + socket.inet_aton(server_id)
+    return _build_frame(mac, xid, options)
+
+
+def parse_reply(
+    buf: memoryview, *, include_raw_options: bool = False
+) -> Optional[Tuple[int, str, Dict[str, object]]]:
+    """Decode an Ethernet/IPv4/UDP/BOOTP frame into ``(xid, yiaddr, options)``."""
+    if len(buf) < ETHER_HEADER_LEN + 20:
+        return None
+    if (buf[12] << 8 | buf[13]) != _ETHERTYPE_IPV4:
+        return None
+    if buf[ETHER_HEADER_LEN + 9] != socket.IPPROTO_UDP:
+        return None
+    ihl = (buf[ETHER_HEADER_LEN] & 0x0F) * 4
+    udp_off = ETHER_HEADER_LEN + ihl
+    if len(buf) < udp_off + 8:
+        return None
+    if (buf[udp_off + 2] << 8 | buf[udp_off + 3]) != 68:
+        return None
+    return parse_bootp(buf, udp_off + 8, include_raw_options=include_raw_options)
+
+
+def parse_bootp(
+    buf: memoryview, bootp_off: int = 0, *, include_raw_options: bool = False
+) -> Optional[Tuple[int, str, Dict[str, object]]]:
+    """
+    Decode the BOOTP message at ``bootp_off`` into ``(xid, yiaddr, options)``.
+
+    Only server replies (``op == 2``) are accepted. Unless
+    ``include_raw_options`` is set, only the options that feed
+    :class:`DhcpLease` fields are decoded.
+    """
+    if len(buf) < bootp_off + BOOTP_HEADER.size:
+        return None
+    fields = BOOTP_HEADER.unpack_from(buf, bootp_off)
+    if fields[0] != 2 or fields[13] != _DHCP_MAGIC_COOKIE:
+        return None
+    xid = fields[4]
+    yiaddr = socket.inet_ntoa(fields[8])
+
+    options: Dict[str, object] = {}
+    codes, offsets, lengths = parse_options(
+        buf, bootp_off + BOOTP_HEADER.size, len(buf)
+    )
+    for code, offset, length in zip(codes, offsets, lengths):
+        if not include_raw_options and code not in _LEASE_OPTION_CODES:
+            continue
+        value = bytes(buf[offset : offset + length])
+        decoder = _DHCP_OPTION_DECODERS.get(code)
+        if decoder is None:
+            options[str(code)] = value
+        else:
+            name, decode = decoder
+            options[name] = decode(value)
+    return xid, yiaddr, options
+
+
+def udp_checksum(src: bytes, dst: bytes, segment: bytes) -> int:
+    pseudo_header = struct.pack(">4s4sHH", src, dst, socket.IPPROTO_UDP, len(segment))
+    total = _ones_complement_sum(pseudo_header) + _ones_complement_sum(segment)
+    total = (total & 0xFFFF) + (total >> 16)
+    return ~total & 0xFFFF or 0xFFFF
+
+
+def _build_frame(mac: bytes, xid: int, options: bytes) -> bytearray:
+    bootp = BOOTP_HEADER.pack(
+        1,
+        1,
+        6,
+        0,
+        xid,
+        0,
+        0x8000,
+        _UNSPECIFIED_ADDR,
+        _UNSPECIFIED_ADDR,
+        _UNSPECIFIED_ADDR,
+        _UNSPECIFIED_ADDR,
+        mac.ljust(16, b"\x00"),
+        bytes(192),
+        _DHCP_MAGIC_COOKIE,
+    )
+    bootp += options + PARAM_REQ_TLV + b"\xff"
+    bootp = bootp.ljust(_MIN_BOOTP_LEN, b"\x00")
+
+    udp_len = _UDP_HEADER.size + len(bootp)
+    segment = bytearray(_UDP_HEADER.pack(68, 67, udp_len, 0) + bootp)
+    struct.pack_into(
+        ">H", segment, 6, udp_checksum(_UNSPECIFIED_ADDR, _BROADCAST_ADDR, segment)
+    )
+    ip_header = bytearray(
+        _IPV4_HEADER.pack(
+            0x45,
+            0,
+            _IPV4_HEADER.size + udp_len,
+            1,
+            0,
+            64,
+            socket.IPPROTO_UDP,
+            0,
+            _UNSPECIFIED_ADDR,
+            _BROADCAST_ADDR,
+        )
+    )
+    struct.pack_into(">H", ip_header, 10, _ipv4_checksum(ip_header))
+
+    frame = bytearray(_BROADCAST_MAC)
+    frame += mac
+    frame += struct.pack(">H", _ETHERTYPE_IPV4)
+    frame += ip_header
+    frame += segment
+    return frame
+
+
+def _ipv4_checksum(header: bytes) -> int:
+    return ~_ones_complement_sum(header) & 0xFFFF
+
+
+def _ones_complement_sum(data: bytes) -> int:
+    """Return the RFC 1071 ones' complement sum of ``data``'s 16-bit words."""
+    total = int.from_bytes(data, "big")
+    if len(data) & 1:
+        total <<= 8
+    # 2**16 is congruent to 1 modulo 0xFFFF, so reducing the whole buffer as
+    # one wide integer folds every 16-bit word and carry in a single step.
+    return total % 0xFFFF or (0xFFFF if total else 0)
+
+
+def _decode_ipv4(value: bytes) -> Optional[str]:
+    return socket.inet_ntoa(value[:4]) if len(value) >= 4 else None
+
+
+def _decode_ipv4_list(value: bytes) -> List[str]:
+    return [socket.inet_ntoa(value[i : i + 4]) for i in range(0, len(value) - 3, 4)]
+
+
+def _decode_uint(value: bytes) -> int:
+    return int.from_bytes(value, "big")
+
+
+_DHCP_OPTION_DECODERS = {
+    1: ("subnet_mask", _decode_ipv4),
+    3: ("router", _decode_ipv4_list),
+    6: ("name_server", _decode_ipv4_list),
+    15: ("domain", bytes),
+    51: ("lease_time", _decode_uint),
+    53: ("message-type", _decode_uint),
+    54: ("server_id", _decode_ipv4),
+    58: ("renewal_time", _decode_uint),
+    59: ("rebinding_time", _decode_uint),
+}
@@ -0,0 +1,128 @@
+"""Frame builders that patch DHCP templates built once by Scapy."""
+
+import socket
+import struct
+from typing import List, Optional
+
+from scapy.all import BOOTP, DHCP, Ether, IP, UDP
+from scapy.utils import mac2str
+
+from ._raw import BOOTP_HEADER, BOOTP_OFF, ETHER_HEADER_LEN, PARAM_REQ_TLV, udp_checksum
+
+# Fixed offsets into the frames built by _build_dhcp_packet.
+_SRC_MAC_OFF = 6
+_IP_SRC_OFF = ETHER_HEADER_LEN + 12
+_UDP_OFF = ETHER_HEADER_LEN + 20
+_UDP_CHK_OFF = _UDP_OFF + 6
+_XID_OFF = BOOTP_OFF + 4
+_CHADDR_OFF = BOOTP_OFF + 28
+_OPTIONS_OFF = BOOTP_OFF + BOOTP_HEADER.size
+_REQUESTED_ADDR_OFF = _OPTIONS_OFF + 3 + 2
+_SERVER_ID_OFF = _REQUESTED_ADDR_OFF + 4 + 2
+
+
+def build_discover(mac_bytes: bytes, xid: int) -> bytearray:
+    """Copy the DHCPDISCOVER template and patch in the client MAC and xid."""
+    frame = _DISCOVER_TEMPLATE[:]
+    _patch_client(frame, mac_bytes, xid)
+    _set_udp_checksum(frame)
+    return frame
+
+
+def build_request(
+    mac_bytes: bytes,
+    xid: int,
+    requested_ip: str,
+    server_id: Optional[str],
+) -> bytearray:
+    """Copy the DHCPREQUEST template and patch in the client and lease fields."""
+    frame = _REQUEST_TEMPLATE[:]
+    _patch_client(frame, mac_bytes, xid)
+    frame[_REQUESTED_ADDR_OFF : _REQUESTED_ADDR_OFF + 4] = socket.inet_aton(
+        requested_ip
+    )
+    if server_id:
+        frame[_SERVER_ID_OFF : _SERVER_ID_OFF + 4] = socket.inet_aton(server_id)
+    else:
+        # Blank the whole server_id TLV with pad options.
+        frame[_SERVER_ID_OFF - 2 : _SERVER_ID_OFF + 4] = bytes(6)
+    _set_udp_checksum(frame)
+    return frame
+
+
+def _build_dhcp_packet(
+    *,
+    message_type: str,
+    mac_address: str,
+    xid: int,
+    requested_ip: Optional[str] = None,
+    server_id: Optional[str] = None,
+):
+    options: List[object] = [("message-type", message_type)]
+    if requested_ip:
+        options.append(("requested_addr", requested_ip))
+    if server_id:
+        options.append(("server_id", server_id))
+    options.append(PARAM_REQ_TLV)
+    options.append("end")
+
+    bootp = BOOTP(
+        op=1,
+        chaddr=_mac_to_chaddr(mac_address),
+        xid=xid,
+        flags=0x8000,
+        ciaddr="0.0.0.0",
+        yiaddr="0.0.0.0",
+        siaddr="0.0.0.0",
+        giaddr="0.0.0.0",
+    )
+    return (
+        Ether(dst="ff:ff:ff:ff:ff:ff", src=mac_address)
+        / IP(src="0.0.0.0", dst="255.255.255.255")
+        / UDP(sport=68, dport=67)
+        / bootp
+        / DHCP(options=options)
+    )
+
+
+def _patch_client(frame: bytearray, mac_bytes: bytes, xid: int) -> None:
+    struct.pack_into(">I", frame, _XID_OFF, xid)
+    frame[_CHADDR_OFF : _CHADDR_OFF + 6] = mac_bytes
+    frame[_SRC_MAC_OFF : _SRC_MAC_OFF + 6] = mac_bytes
+
+
+def _set_udp_checksum(frame: bytearray) -> None:
+    # The IPv4 header never changes between clients, so only UDP needs fixing.
+    frame[_UDP_CHK_OFF : _UDP_CHK_OFF + 2] = b"\x00\x00"
+    checksum = udp_checksum(
+        frame[_IP_SRC_OFF : _IP_SRC_OFF + 4],
+        frame[_IP_SRC_OFF + 4 : _UDP_OFF],
+        frame[_UDP_OFF:],
+    )
+    struct.pack_into(">H", frame, _UDP_CHK_OFF, checksum)
+
+
+def _mac_to_chaddr(mac_address: str) -> bytes:
+    return mac2str(mac_address) + b"\x00" * 10
+
+
+_DISCOVER_TEMPLATE = bytearray(
+    bytes(
+        _build_dhcp_packet(
+            message_type="discover",
+            mac_address="00:00:00:00:00:00",
+            xid=0,
+        )
+    )
+)
+_REQUEST_TEMPLATE = bytearray(
+    bytes(
+        _build_dhcp_packet(
+            message_type="request",
+            mac_address="00:00:00:00:00:00",
+            xid=0,
+            requested_ip="0.0.0.0",
+            server_id="0.0.0.0",
+        )
+    )
+)
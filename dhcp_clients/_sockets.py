@@ -0,0 +1,138 @@
+"""Socket helpers shared by the blocking client and the asyncio simulator."""
+
+import ctypes
+import os
+import socket
+import struct
+from typing import Sequence
+
+_ETH_P_ALL = 0x0003
+_SO_ATTACH_FILTER = 26
+RECV_BUFSIZE = 2048
+
+# Classic BPF for "udp and src port 67 and dst port 68" (tcpdump -dd).
+_BOOTP_REPLY_FILTER = [
+    (0x28, 0, 0, 12),  # ldh [12]
+    (0x15, 0, 10, 0x0800),  # jeq IPv4
+    (0x30, 0, 0, 23),  # ldb [23]
+    (0x15, 0, 8, 17),  # jeq UDP
+    (0x28, 0, 0, 20),  # ldh [20]
+    (0x45, 6, 0, 0x1FFF),  # jset fragment offset
+    (0xB1, 0, 0, 14),  # ldxb 4*([14]&0xf)
+    (0x48, 0, 0, 14),  # ldh [x + 14]
+    (0x15, 0, 3, 67),  # jeq src port 67
+    (0x48, 0, 0, 16),  # ldh [x + 16]
+    (0x15, 0, 1, 68),  # jeq dst port 68
+    (0x06, 0, 0, 0x40000),  # ret accept
+    (0x06, 0, 0, 0),  # ret drop
+]
+
+
+class _IoVec(ctypes.Structure):
+    _fields_ = [("iov_base", ctypes.c_void_p), ("iov_len", ctypes.c_size_t)]
+
+
+class _MsgHdr(ctypes.Structure):
+    _fields_ = [
+        ("msg_name", ctypes.c_void_p),
+        ("msg_namelen", ctypes.c_uint32),
+        ("msg_iov", ctypes.POINTER(_IoVec)),
+        ("msg_iovlen", ctypes.c_size_t),
+        ("msg_control", ctypes.c_void_p),
+        ("msg_controllen", ctypes.c_size_t),
+        ("msg_flags", ctypes.c_int),
+    ]
+
+
+class _MMsgHdr(ctypes.Structure):
+    _fields_ = [("msg_hdr", _MsgHdr), ("msg_len", ctypes.c_uint)]
+
+
+_libc_sendmmsg = getattr(ctypes.CDLL(None, use_errno=True), "sendmmsg", None)
+if _libc_sendmmsg is not None:
+    _libc_sendmmsg.argtypes = [
+        ctypes.c_int,
+        ctypes.POINTER(_MMsgHdr),
+        ctypes.c_uint,
+        ctypes.c_int,
+    ]
+    _libc_sendmmsg.restype = ctypes.c_int
+
+
+def open_packet_socket(iface: str) -> socket.socket:
+    sock = socket.socket(socket.AF_PACKET, socket.SOCK_RAW, socket.htons(_ETH_P_ALL))
+    try:
+        program = b"".join(struct.pack("HBBI", *insn) for insn in _BOOTP_REPLY_FILTER)
+        filter_buf = ctypes.create_string_buffer(program)
+        fprog = struct.pack(
+            "HL", len(_BOOTP_REPLY_FILTER), ctypes.addressof(filter_buf)
+        )
+        sock.setsockopt(socket.SOL_SOCKET, _SO_ATTACH_FILTER, fprog)
+        sock.bind((iface, _ETH_P_ALL))
+    except BaseException:
+        sock.close()
+        raise
+    return sock
+
+
+def open_udp_socket(iface: str) -> socket.socket:
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    try:
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_BROADCAST, 1)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_BINDTODEVICE, iface.encode())
+        sock.bind(("", 68))
+    except BaseException:
+        sock.close()
+        raise
+    return sock
+
+
+def sendmmsg(sock: socket.socket, buffers: Sequence[bytearray]) -> int:
+    """
+    Send the frames in ``buffers`` on a bound packet socket, in order.
+
+    Uses one ``sendmmsg(2)`` call per batch where libc provides it, falling
+    back to a ``send`` per frame otherwise. Returns how many frames were sent.
+    As with ``sendmmsg(2)``, an error after at least one frame went out ends
+    the call early and is raised by the next call for the remaining frames.
+    """
+    if _libc_sendmmsg is None:
+        for sent, buffer in enumerate(buffers):
+            try:
+                sock.send(buffer)
+            except OSError:
+                if sent:
+                    return sent
+                raise
+        return len(buffers)
+
+    count = len(buffers)
+    iovecs = (_IoVec * count)()
+    messages = (_MMsgHdr * count)()
+    # Keep the ctypes views alive until the syscall has copied the frames.
+    views = [(ctypes.c_char * len(buffer)).from_buffer(buffer) for buffer in buffers]
+    for index, view in enumerate(views):
+        iovecs[index].iov_base = ctypes.addressof(view)
+        iovecs[index].iov_len = len(view)
+        messages[index].msg_hdr.msg_iov = ctypes.pointer(iovecs[index])
+        messages[index].msg_hdr.msg_iovlen = 1
+
+    sent = 0
+    while sent < count:
+        result = _libc_sendmmsg(
+            sock.fileno(),
+            ctypes.cast(
+                ctypes.byref(messages, sent * ctypes.sizeof(_MMsgHdr)),
+                ctypes.POINTER(_MMsgHdr),
+            ),
+            count - sent,
+            0,
+        )
+        if result < 0:
+            if sent:
+                return sent
+            error = ctypes.get_errno()
+            raise OSError(error, os.strerror(error))
+        sent += result
+    return sent
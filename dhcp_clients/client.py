@@ -1,45 +1,158 @@
 import os
+import queue
 import random
-from dataclasses import dataclass
-from typing import Dict, Iterable, List, Optional, Tuple
-
-from scapy.all import (
-    BOOTP,
-    DHCP,
-    Ether,
-    IP,
-    UDP,
-    conf,
-    get_if_hwaddr,
-    srp1,
-)
+import select
+import threading
+import time
+from contextlib import nullcontext
+from typing import Callable, Collection, Dict, Optional, Tuple
+
+from scapy.all import conf, get_if_hwaddr
+from scapy.interfaces import network_name
 from scapy.utils import mac2str
 import socket
 
+from ._handshake import DhcpLease, frame_builders, lease_from_options, retry_timeout
+from ._raw import (
+    BOOTP_OFF,
+    DHCPACK,
+    DHCPNAK,
+    DHCPOFFER,
+    ETHER_HEADER_LEN,
+    parse_bootp,
+    parse_reply,
+)
+from ._sockets import RECV_BUFSIZE, open_packet_socket, open_udp_socket
 
-@dataclass
-class DhcpLease:
-    """Captured information returned by the DHCP server."""
-
-    assigned_ip: str
-    server_id: Optional[str]
-    lease_time: Optional[int]
-    subnet_mask: Optional[str]
-    router: Optional[str]
-    dns_servers: List[str]
-    raw_options: Dict[str, object]
+_DHCP_SERVER_ADDR = ("255.255.255.255", 67)
+_DEMUX_POLL_INTERVAL = 0.2
 
 
 class DhcpHandshakeError(RuntimeError):
     """Raised when the DHCP four-way handshake cannot be completed."""
 
 
+class XidDemux:
+    """
+    Share one packet socket between handshakes running in several threads.
+
+    A single reader thread owns every ``recv`` on the socket and routes each
+    reply to the queue registered for its xid, so concurrent handshakes never
+    consume each other's replies. Pass the instance as ``demux`` to
+    :func:`perform_handshake`. Closing the demux also closes the socket.
+
+    If the socket fails, e.g. because the interface went down, the error is
+    raised from every later :meth:`exchange` and from :meth:`close`.
+
+    For example, to run one handshake per MAC address from a thread pool::
+
+        with XidDemux(open_dhcp_socket("eth0")) as demux:
+            with ThreadPoolExecutor(max_workers=16) as pool:
+                leases = list(
+                    pool.map(
+                        lambda mac: perform_handshake(
+                            "eth0", client_mac=mac, demux=demux
+                        ),
+                        macs,
+                    )
+                )
+    """
+
+    def __init__(self, sock: socket.socket) -> None:
+        self._sock = sock
+        self._queues: Dict[int, queue.SimpleQueue] = {}
+        self._error: Optional[Exception] = None
+        self._closed = threading.Event()
+        self._reader = threading.Thread(
+            target=self._loop, name="dhcp-xid-demux", daemon=True
+        )
+        self._reader.start()
+
+    def __enter__(self) -> "XidDemux":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    def close(self) -> None:
+        self._closed.set()
+        self._reader.join()
+        self._sock.close()
+        if self._error is not None:
+            raise self._error
+
+    def exchange(
+        self,
+        frame: bytearray,
+        *,
+        xid: int,
+        timeout: float,
+        message_types: Collection[int],
+        include_raw_options: bool = False,
+    ):
+        replies: queue.SimpleQueue = queue.SimpleQueue()
+        self._queues[xid] = replies
+        try:
+            # Checked after registering, so a reader failure from now on
+            # also wakes this queue.
+            if self._error is not None:
+                raise self._error
+            self._sock.send(frame)
+            deadline = time.monotonic() + timeout
+            while True:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return None
+                try:
+                    data = replies.get(timeout=remaining)
+                except queue.Empty:
+                    return None
+                if data is None:
+                    raise self._error
+                reply = parse_reply(
+                    memoryview(data), include_raw_options=include_raw_options
+                )
+                if reply is not None and reply[2].get("message-type") in message_types:
+                    return reply
+        finally:
+            self._queues.pop(xid, None)
+
+    def _loop(self) -> None:
+        try:
+            while not self._closed.is_set():
+                readable, _, _ = select.select(
+                    [self._sock], [], [], _DEMUX_POLL_INTERVAL
+                )
+                if not readable:
+                    continue
+                data = self._sock.recv(RECV_BUFSIZE)
+                replies = self._queues.get(_frame_xid(data))
+                if replies is not None:
+                    replies.put(data)
+        except (OSError, ValueError) as exc:
+            # select() raises ValueError once the caller has closed the socket.
+            if self._closed.is_set():
+                return
+            self._error = exc
+            for replies in list(self._queues.values()):
+                replies.put(None)
+
+
 def perform_handshake(
     interface: Optional[str] = None,
     *,
     timeout: float = 5.0,
     retries: int = 3,
     client_mac: Optional[str] = None,
+    xid: Optional[int] = None,
+    backoff_cutoff: float = 64.0,
+    backoff_jitter: float = 1.0,
+    sock: Optional[socket.socket] = None,
+    transport: str = "packet",
+    include_raw_options: bool = False,
+    demux: Optional[XidDemux] = None,
+    rng: Optional[random.Random] = None,
+    backend: str = "scapy",
 ) -> DhcpLease:
     """
     Perform the DHCP discover → offer → request → ack handshake.
@@ -49,153 +162,199 @@ def perform_handshake(
     interface:
         Network interface name to use. Defaults to the Scapy configured interface.
     timeout:
-        Seconds to wait for each server response.
+        Seconds to wait for a server response on the first attempt. Each retry
+        doubles the wait, as recommended by RFC 2131.
     retries:
         Number of times to retry the discover/offer cycle before giving up.
     client_mac:
         Optional MAC address to use for the DHCP frames. If omitted, the
         interface hardware address is used.
+    xid:
+        Optional BOOTP transaction id reused by every attempt. If omitted, a
+        fresh random id is drawn for each attempt.
+    backoff_cutoff:
+        Upper bound in seconds for the doubled per-attempt wait.
+    backoff_jitter:
+        Maximum random offset in seconds added to or subtracted from each wait
+        so that many clients do not retransmit in lockstep.
+    sock:
+        Optional socket from :func:`open_dhcp_socket` to reuse across
+        sequential handshakes. It is left open; when omitted, a socket is
+        opened and closed for this handshake. It must match ``transport``.
+    transport:
+        ``"packet"`` (default) sends whole Ethernet frames on a raw
+        ``AF_PACKET`` socket, which works before the interface has an address.
+        ``"udp"`` sends only the BOOTP payload on a broadcast UDP socket bound
+        to port 68 and lets the kernel build the lower layers; the frames then
+        carry the interface's own source MAC.
+    include_raw_options:
+        Decode every option of the ACK into ``DhcpLease.raw_options``. By
+        default only the options backing the lease fields are decoded and
+        ``raw_options`` is left empty.
+    demux:
+        Optional :class:`XidDemux` wrapping a ``"packet"`` socket, for
+        handshakes that run concurrently in several threads. Takes precedence
+        over ``sock``.
+    rng:
+        Optional random generator for transaction ids and backoff jitter.
+        Threads running handshakes in parallel should each pass their own so
+        they do not contend on a shared generator. A fresh one is created
+        when omitted.
+    backend:
+        ``"scapy"`` (default) patches frame templates that Scapy built at
+        import time. ``"raw"`` packs every frame with :mod:`struct` and never
+        touches Scapy packet classes. Both produce the same
+        :class:`DhcpLease`.
     """
     _ensure_root_privileges()
-    conf.checkIPaddr = False
-    iface = interface or conf.iface
-    if not iface:
-        raise DhcpHandshakeError(
-            "Missing network interface; pass --iface or configure Scapy."
-        )
-
+    iface = _resolve_interface(interface)
+    open_socket, exchange = _transport(transport)
+    fill_discover, fill_request = frame_builders(backend)
+    if demux is not None:
+        sock, exchange = demux, XidDemux.exchange
     mac_address = client_mac or get_if_hwaddr(iface)
-    for attempt in range(retries):
-        xid = random.randint(0, 0xFFFFFFFF)
-        offer = _send_and_receive(
-            _build_dhcp_packet(
-                message_type="discover",
-                mac_address=mac_address,
-                xid=xid,
-            ),
-            iface=iface,
-            timeout=timeout,
-        )
-        if offer is None or BOOTP not in offer:
-            continue
-        offer_bootp = offer[BOOTP]
-        if offer_bootp.xid != xid:
-            continue
-
-        requested_ip = offer_bootp.yiaddr
-        options = _options_to_dict(offer[DHCP].options) if DHCP in offer else {}
-        server_id = _first_option(options, "server_id")
-
-        request_packet = _build_dhcp_packet(
-            message_type="request",
-            mac_address=mac_address,
-            xid=xid,
-            requested_ip=requested_ip,
-            server_id=server_id,
-        )
-        ack = _send_and_receive(
-            request_packet,
-            iface=iface,
-            timeout=timeout,
-        )
-        if ack is None or BOOTP not in ack:
-            continue
-        ack_bootp = ack[BOOTP]
-        if ack_bootp.xid != xid:
-            continue
-
-        ack_options = _options_to_dict(ack[DHCP].options) if DHCP in ack else {}
-        return DhcpLease(
-            assigned_ip=ack_bootp.yiaddr,
-            server_id=_to_ipv4_str(_first_option(ack_options, "server_id")),
-            lease_time=_first_option(ack_options, "lease_time"),
-            subnet_mask=_to_ipv4_str(_first_option(ack_options, "subnet_mask")),
-            router=_normalize_router(_first_option(ack_options, "router")),
-            dns_servers=_normalize_dns(_first_option(ack_options, "name_server")),
-            raw_options=ack_options,
-        )
+    mac_bytes = mac2str(mac_address)
+    if rng is None:
+        rng = random.Random()
+    with nullcontext(sock) if sock is not None else open_socket(iface) as sock:
+        for attempt in range(retries):
+            attempt_xid = xid if xid is not None else rng.getrandbits(32)
+            wait = retry_timeout(attempt, timeout, backoff_cutoff, backoff_jitter, rng)
+            discover = fill_discover(mac_bytes, attempt_xid)
+            offer = exchange(
+                sock,
+                discover,
+                xid=attempt_xid,
+                timeout=wait,
+                message_types=(DHCPOFFER,),
+            )
+            if offer is None:
+                continue
+            _, requested_ip, options = offer
+            server_id = options.get("server_id")
+
+            request_packet = fill_request(
+                mac_bytes, attempt_xid, requested_ip, server_id
+            )
+            ack = exchange(
+                sock,
+                request_packet,
+                xid=attempt_xid,
+                timeout=wait,
+                message_types=(DHCPACK, DHCPNAK),
+                include_raw_options=include_raw_options,
+            )
+            if ack is None or ack[2].get("message-type") == DHCPNAK:
+                continue
+            _, assigned_ip, ack_options = ack
+            return lease_from_options(assigned_ip, ack_options, include_raw_options)
 
     raise DhcpHandshakeError(
         f"No DHCP ACK received after {retries} discover/request attempts on {iface}."
     )
 
 
-def _send_and_receive(packet, *, iface: str, timeout: float):
-    return srp1(
-        packet,
-        iface=iface,
-        timeout=timeout,
-        retry=0,
-        verbose=False,
-    )
+def open_dhcp_socket(
+    interface: Optional[str] = None, *, transport: str = "packet"
+) -> socket.socket:
+    """
+    Open a socket that sends DHCP messages and receives server replies.
+
+    The socket only delivers UDP 67 → 68 traffic. Replies are matched by xid,
+    so a socket must not be shared by handshakes running at the same time;
+    wrap it in :class:`XidDemux` for that.
+    """
+    _ensure_root_privileges()
+    open_socket, _ = _transport(transport)
+    return open_socket(_resolve_interface(interface))
+
+
+def _transport(name: str):
+    if name == "packet":
+        return open_packet_socket, _send_and_receive
+    if name == "udp":
+        return open_udp_socket, _send_via_udp
+    raise ValueError("transport must be either 'packet' or 'udp'.")
+
+
+def _resolve_interface(interface: Optional[str]) -> str:
+    iface = interface or conf.iface
+    if not iface:
+        raise DhcpHandshakeError(
+            "Missing network interface; pass --iface or configure Scapy."
+        )
+    return network_name(iface)
 
 
-def _build_dhcp_packet(
+def _send_and_receive(
+    sock: socket.socket,
+    frame: bytearray,
     *,
-    message_type: str,
-    mac_address: str,
     xid: int,
-    requested_ip: Optional[str] = None,
-    server_id: Optional[str] = None,
+    timeout: float,
+    message_types: Collection[int],
+    include_raw_options: bool = False,
 ):
-    params = [1, 3, 6, 15, 51, 54, 58, 59]
-    options: List[Tuple[str, object]] = [("message-type", message_type)]
-    if requested_ip:
-        options.append(("requested_addr", requested_ip))
-    if server_id:
-        options.append(("server_id", server_id))
-    options.append(("param_req_list", params))
-    options.append("end")
-
-    bootp = BOOTP(
-        op=1,
-        chaddr=_mac_to_chaddr(mac_address),
-        xid=xid,
-        flags=0x8000,
-        ciaddr="0.0.0.0",
-        yiaddr="0.0.0.0",
-        siaddr="0.0.0.0",
-        giaddr="0.0.0.0",
-    )
-    return (
-        Ether(dst="ff:ff:ff:ff:ff:ff", src=mac_address)
-        / IP(src="0.0.0.0", dst="255.255.255.255")
-        / UDP(sport=68, dport=67)
-        / bootp
-        / DHCP(options=options)
+    sock.send(frame)
+    return _receive_reply(
+        sock, parse_reply, xid, message_types, timeout, include_raw_options
     )
 
 
-def _options_to_dict(options: Iterable):
-    parsed: Dict[str, object] = {}
-    for entry in options:
-        if isinstance(entry, tuple) and len(entry) >= 2:
-            key = entry[0]
-            value = entry[1]
-            parsed[key] = value
-    return parsed
-
-
-def _first_option(options: Dict[str, object], key: str):
-    value = options.get(key)
-    if isinstance(value, (list, tuple)) and len(value) == 1:
-        return value[0]
-    return value
+def _send_via_udp(
+    sock: socket.socket,
+    frame: bytearray,
+    *,
+    xid: int,
+    timeout: float,
+    message_types: Collection[int],
+    include_raw_options: bool = False,
+):
+    # The kernel adds the Ethernet, IPv4 and UDP headers itself.
+    sock.sendto(memoryview(frame)[BOOTP_OFF:], _DHCP_SERVER_ADDR)
+    return _receive_reply(
+        sock, parse_bootp, xid, message_types, timeout, include_raw_options
+    )
 
 
-def _normalize_router(value):
-    if isinstance(value, (list, tuple)):
-        value = value[0] if value else None
-    return _to_ipv4_str(value)
+def _receive_reply(
+    sock: socket.socket,
+    parse: Callable[..., Optional[Tuple[int, str, Dict[str, object]]]],
+    xid: int,
+    message_types: Collection[int],
+    timeout: float,
+    include_raw_options: bool,
+):
+    # Replies of any other type, e.g. a second server's OFFER while waiting
+    # for the ACK, are ignored until the deadline.
+    deadline = time.monotonic() + timeout
+    while True:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            return None
+        readable, _, _ = select.select([sock], [], [], remaining)
+        if not readable:
+            return None
+        reply = parse(
+            memoryview(sock.recv(RECV_BUFSIZE)),
+            include_raw_options=include_raw_options,
+        )
+        if (
+            reply is not None
+            and reply[0] == xid
+            and reply[2].get("message-type") in message_types
+        ):
+            return reply
 
 
-def _normalize_dns(value):
-    if value is None:
-        return []
-    if isinstance(value, (list, tuple)):
-        return [_to_ipv4_str(v) for v in value if v is not None]
-    converted = _to_ipv4_str(value)
-    return [converted] if converted else []
+def _frame_xid(frame: bytes) -> Optional[int]:
+    # The socket filter already guarantees IPv4/UDP, so only locate BOOTP.
+    if len(frame) <= ETHER_HEADER_LEN:
+        return None
+    xid_off = ETHER_HEADER_LEN + (frame[ETHER_HEADER_LEN] & 0x0F) * 4 + 8 + 4
+    if len(frame) < xid_off + 4:
+        return None
+    return int.from_bytes(frame[xid_off : xid_off + 4], "big")
 
 
 def _ensure_root_privileges():
@@ -204,15 +363,3 @@ def _ensure_root_privileges():
             raise PermissionError(
                 "Scapy DHCP handshake must run as root or with CAP_NET_RAW."
             )
-
-
-def _mac_to_chaddr(mac_address: str) -> bytes:
-    return mac2str(mac_address) + b"\x00" * 10
-
-
-def _to_ipv4_str(value):
-    if value is None:
-        return None
-    if isinstance(value, (bytes, bytearray)) and len(value) == 4:
-        return socket.inet_ntoa(value)
-    return str(value)
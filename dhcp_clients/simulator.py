@@ -1,31 +1,64 @@
 from __future__ import annotations
 
+import asyncio
+import errno
+import math
 import random
-from concurrent.futures import ThreadPoolExecutor, as_completed
-from dataclasses import dataclass
-from typing import Generator, Iterable, List, Optional, Sequence, Tuple
+import socket
+import time
+from bisect import bisect_left
+from dataclasses import dataclass, field
+from itertools import accumulate
+from typing import (
+    Awaitable,
+    Callable,
+    Collection,
+    Dict,
+    Iterator,
+    List,
+    Optional,
+    Sequence,
+    Set,
+    Tuple,
+)
 
-from .client import DhcpLease, DhcpHandshakeError, perform_handshake
+from scapy.utils import mac2str
 
+from ._handshake import frame_builders, lease_from_options, retry_timeout
+from ._raw import DHCPACK, DHCPNAK, DHCPOFFER, parse_reply
+from ._sockets import RECV_BUFSIZE, sendmmsg
+from .client import DhcpHandshakeError, DhcpLease, open_dhcp_socket
 
-@dataclass
-class SimulationResult:
-    """Summary of a bulk DHCP simulation run."""
+_Reply = Tuple[int, str, Dict[str, object]]
+# xid -> (waiting future, DHCP message types that resolve it)
+_Pending = Dict[int, Tuple[asyncio.Future, Collection[int]]]
 
-    successes: List[Tuple[str, DhcpLease]]
-    failures: List[Tuple[str, str]]
+# Log-linear latency buckets: exact below 32 ns, then 16 buckets per power of
+# two (about 6% relative error), enough for any 64-bit nanosecond value.
+_LATENCY_BUCKETS = 1024
 
-    @property
-    def total(self) -> int:
-        return len(self.successes) + len(self.failures)
 
-    @property
-    def succeeded(self) -> int:
-        return len(self.successes)
+@dataclass(slots=True)
+class SimulationResult:
+    """
+    Summary of a bulk DHCP simulation run.
+
+    ``successes`` and ``failures`` are only populated when the run was not
+    given ``on_success`` / ``on_failure`` callbacks; the counters always are.
+    ``latency_histogram`` counts successful handshake durations per bucket.
+    """
+
+    succeeded: int = 0
+    failed: int = 0
+    successes: List[Tuple[str, DhcpLease]] = field(default_factory=list)
+    failures: List[Tuple[str, str]] = field(default_factory=list)
+    latency_histogram: List[int] = field(
+        default_factory=lambda: [0] * _LATENCY_BUCKETS, repr=False
+    )
 
     @property
-    def failed(self) -> int:
-        return len(self.failures)
+    def total(self) -> int:
+        return self.succeeded + self.failed
 
     @property
     def success_rate(self) -> float:
@@ -33,6 +66,29 @@ class SimulationResult:
             return 0.0
         return self.succeeded / self.total
 
+    def record_latency(self, nanoseconds: int) -> None:
+        self.latency_histogram[_latency_bucket(nanoseconds)] += 1
+
+    def latency_percentiles(
+        self, percentiles: Sequence[float] = (50, 95, 99, 99.9)
+    ) -> List[Optional[int]]:
+        """
+        Return the handshake latency in nanoseconds at each percentile.
+
+        Values are bucket upper bounds, so they overestimate by at most ~6%.
+        ``None`` is returned for every percentile when nothing was recorded.
+        """
+        samples = sum(self.latency_histogram)
+        if samples == 0:
+            return [None] * len(percentiles)
+        cumulative = list(accumulate(self.latency_histogram))
+        values: List[Optional[int]] = []
+        for percentile in percentiles:
+            rank = max(1, math.ceil(samples * percentile / 100))
+            bucket = bisect_left(cumulative, rank)
+            values.append(_latency_bucket_upper(bucket))
+        return values
+
 
 def simulate_dhcp_clients(
     *,
@@ -43,10 +99,18 @@ def simulate_dhcp_clients(
     retries: int,
     mac_prefix: Optional[str] = None,
     random_seed: Optional[int] = None,
+    backoff_cutoff: float = 64.0,
+    backoff_jitter: float = 1.0,
+    on_success: Optional[Callable[[str, DhcpLease], None]] = None,
+    on_failure: Optional[Callable[[str, str], None]] = None,
+    backend: str = "scapy",
 ) -> SimulationResult:
     """
     Run multiple DHCP handshakes concurrently with distinct client identities.
 
+    All clients share a single raw socket driven by an asyncio event loop;
+    replies are dispatched to the waiting client by their BOOTP xid.
+
     Parameters
     ----------
     count:
@@ -56,73 +120,296 @@ def simulate_dhcp_clients(
     interface:
         Network interface name to use for the raw frames.
     timeout:
-        Seconds to wait for each server response.
+        Seconds to wait for a server response on the first attempt; doubled on
+        every retry.
     retries:
         Number of times to retry the discover/offer cycle before giving up.
     mac_prefix:
         Optional MAC prefix (1-5 octets) used as the starting bytes of every
         simulated client address.
     random_seed:
-        Optional seed to randomise the MAC address space starting point.
+        Optional seed to randomise the MAC address space starting point. It
+        also seeds the per-worker generators used for transaction ids and
+        backoff jitter.
+    backoff_cutoff:
+        Upper bound in seconds for the doubled per-attempt wait.
+    backoff_jitter:
+        Maximum random offset in seconds applied to each per-attempt wait.
+    on_success:
+        Optional callback invoked with ``(mac, lease)`` for every completed
+        handshake, e.g. to stream results to a JSONL file. When given, leases
+        are not kept in ``SimulationResult.successes``.
+    on_failure:
+        Optional callback invoked with ``(mac, error)`` for every failed
+        handshake. When given, ``SimulationResult.failures`` stays empty.
+    backend:
+        Frame builder to use, ``"scapy"`` (default) or ``"raw"``; see
+        :func:`~dhcp_clients.client.perform_handshake`.
     """
     if count <= 0:
         raise ValueError("count must be positive.")
     if concurrency <= 0:
         raise ValueError("concurrency must be positive.")
 
-    mac_iter = _iter_mac_addresses(count, mac_prefix, random_seed)
-    successes: List[Tuple[str, DhcpLease]] = []
-    failures: List[Tuple[str, str]] = []
-    max_workers = min(count, concurrency)
-
-    def _worker(mac: str) -> DhcpLease:
-        return perform_handshake(
-            interface,
+    fill_discover, fill_request = frame_builders(backend)
+    macs = _iter_mac_addresses(count, mac_prefix, random_seed)
+    rng = random.Random(random_seed)
+    return asyncio.run(
+        _simulate(
+            macs,
+            workers=min(count, concurrency),
+            interface=interface,
             timeout=timeout,
             retries=retries,
-            client_mac=mac,
+            backoff_cutoff=backoff_cutoff,
+            backoff_jitter=backoff_jitter,
+            on_success=on_success,
+            on_failure=on_failure,
+            rng=rng,
+            fill_discover=fill_discover,
+            fill_request=fill_request,
         )
+    )
 
-    mac_source = iter(mac_iter)
-    with ThreadPoolExecutor(max_workers=max_workers) as executor:
-        pending = {}
 
-        while len(pending) < max_workers:
-            try:
-                mac = next(mac_source)
-            except StopIteration:
-                break
-            pending[executor.submit(_worker, mac)] = mac
-
-        while pending:
-            future = next(as_completed(list(pending.keys())))
-            mac = pending.pop(future)
+async def _simulate(
+    macs: Iterator[str],
+    *,
+    workers: int,
+    interface: Optional[str],
+    timeout: float,
+    retries: int,
+    backoff_cutoff: float,
+    backoff_jitter: float,
+    on_success: Optional[Callable[[str, DhcpLease], None]],
+    on_failure: Optional[Callable[[str, str], None]],
+    rng: random.Random,
+    fill_discover: Callable[[bytes, int], bytearray],
+    fill_request: Callable[[bytes, int, str, Optional[str]], bytearray],
+) -> SimulationResult:
+    loop = asyncio.get_running_loop()
+    pending: _Pending = {}
+    result = SimulationResult()
+    # xids key the reply dispatch table, so they only need to be unique among
+    # the clients currently in flight.
+    active_xids: Set[int] = set()
+
+    async def _worker(worker_rng: random.Random) -> None:
+        for mac in macs:
+            xid = worker_rng.getrandbits(32)
+            while xid in active_xids:
+                xid = worker_rng.getrandbits(32)
+            active_xids.add(xid)
+            handshake = _run_one(
+                mac,
+                xid,
+                outbox,
+                pending,
+                timeout,
+                retries,
+                backoff_cutoff,
+                backoff_jitter,
+                worker_rng,
+                fill_discover,
+                fill_request,
+            )
             try:
-                lease = future.result()
-                successes.append((mac, lease))
-            except KeyboardInterrupt:
-                raise
-            except DhcpHandshakeError as exc:
-                failures.append((mac, str(exc)))
-            except PermissionError as exc:
-                failures.append((mac, str(exc)))
-            except Exception as exc:  # noqa: BLE001
-                failures.append((mac, f"unexpected error: {exc}"))
+                await _collect(mac, handshake, result, on_success, on_failure)
+            finally:
+                active_xids.discard(xid)
+
+    with open_dhcp_socket(interface) as sock:
+        sock.setblocking(False)
+        outbox = _Outbox(sock, pending)
+        loop.add_reader(sock.fileno(), _on_packet, sock, pending)
+        try:
+            await asyncio.gather(
+                *[_worker(random.Random(rng.getrandbits(64))) for _ in range(workers)]
+            )
+        finally:
+            loop.remove_reader(sock.fileno())
+            loop.remove_writer(sock.fileno())
+
+    return result
+
+
+class _Outbox:
+    """
+    Coalesce frames queued during one event-loop iteration into one batch.
 
+    The batch goes out through ``sendmmsg(2)``, so a burst of Discovers from
+    many clients costs a single syscall. When the socket's send buffer is
+    full, the unsent frames wait until it becomes writable. Frames the kernel
+    drops for lack of buffers (``ENOBUFS``) are treated as lost packets, so
+    their clients time out and retry. Any other error fails the clients whose
+    frames were not sent.
+    """
+
+    def __init__(self, sock: socket.socket, pending: _Pending) -> None:
+        self._sock = sock
+        self._pending = pending
+        self._frames: List[Tuple[int, bytearray]] = []
+        self._awaiting_writable = False
+
+    def send(self, xid: int, frame: bytearray) -> None:
+        if not self._frames and not self._awaiting_writable:
+            asyncio.get_running_loop().call_soon(self._flush)
+        self._frames.append((xid, frame))
+
+    def _flush(self) -> None:
+        while self._frames:
             try:
-                mac = next(mac_source)
-            except StopIteration:
-                continue
-            pending[executor.submit(_worker, mac)] = mac
+                sent = sendmmsg(self._sock, [frame for _, frame in self._frames])
+            except BlockingIOError:
+                self._awaiting_writable = True
+                asyncio.get_running_loop().add_writer(
+                    self._sock.fileno(), self._on_writable
+                )
+                return
+            except OSError as exc:
+                frames, self._frames = self._frames, []
+                if exc.errno != errno.ENOBUFS:
+                    self._fail(frames, exc)
+                return
+            del self._frames[:sent]
+
+    def _on_writable(self) -> None:
+        asyncio.get_running_loop().remove_writer(self._sock.fileno())
+        self._awaiting_writable = False
+        self._flush()
+
+    def _fail(self, frames: List[Tuple[int, bytearray]], exc: OSError) -> None:
+        for xid, _ in frames:
+            future, _ = self._pending.get(xid, (None, ()))
+            if future is not None and not future.done():
+                future.set_exception(exc)
+
+
+async def _collect(
+    mac: str,
+    handshake: Awaitable[DhcpLease],
+    result: SimulationResult,
+    on_success: Optional[Callable[[str, DhcpLease], None]],
+    on_failure: Optional[Callable[[str, str], None]],
+) -> None:
+    started = time.perf_counter_ns()
+    try:
+        lease = await handshake
+    except DhcpHandshakeError as exc:
+        error = str(exc)
+    except Exception as exc:  # noqa: BLE001
+        error = f"unexpected error: {exc}"
+    else:
+        result.succeeded += 1
+        result.record_latency(time.perf_counter_ns() - started)
+        if on_success is None:
+            result.successes.append((mac, lease))
+        else:
+            on_success(mac, lease)
+        return
+
+    result.failed += 1
+    if on_failure is None:
+        result.failures.append((mac, error))
+    else:
+        on_failure(mac, error)
+
+
+async def _run_one(
+    mac: str,
+    xid: int,
+    outbox: _Outbox,
+    pending: _Pending,
+    timeout: float,
+    retries: int,
+    backoff_cutoff: float,
+    backoff_jitter: float,
+    rng: random.Random,
+    fill_discover: Callable[[bytes, int], bytearray],
+    fill_request: Callable[[bytes, int, str, Optional[str]], bytearray],
+) -> DhcpLease:
+    mac_bytes = mac2str(mac)
+    for attempt in range(retries):
+        wait = retry_timeout(attempt, timeout, backoff_cutoff, backoff_jitter, rng)
+        discover = fill_discover(mac_bytes, xid)
+        offer = await _exchange(outbox, pending, discover, xid, wait, (DHCPOFFER,))
+        if offer is None:
+            continue
+        _, requested_ip, options = offer
+        server_id = options.get("server_id")
 
-    return SimulationResult(successes=successes, failures=failures)
+        request_packet = fill_request(mac_bytes, xid, requested_ip, server_id)
+        ack = await _exchange(
+            outbox, pending, request_packet, xid, wait, (DHCPACK, DHCPNAK)
+        )
+        if ack is None or ack[2].get("message-type") == DHCPNAK:
+            continue
+        _, assigned_ip, ack_options = ack
+        return lease_from_options(assigned_ip, ack_options)
+
+    raise DhcpHandshakeError(
+        f"No DHCP ACK received after {retries} discover/request attempts."
+    )
+
+
+async def _exchange(
+    outbox: _Outbox,
+    pending: _Pending,
+    frame: bytearray,
+    xid: int,
+    timeout: float,
+    message_types: Collection[int],
+) -> Optional[_Reply]:
+    future = asyncio.get_running_loop().create_future()
+    pending[xid] = future, message_types
+    try:
+        outbox.send(xid, frame)
+        return await asyncio.wait_for(future, timeout)
+    except asyncio.TimeoutError:
+        return None
+    finally:
+        pending.pop(xid, None)
+
+
+def _on_packet(sock: socket.socket, pending: _Pending) -> None:
+    while True:
+        try:
+            data = sock.recv(RECV_BUFSIZE)
+        except BlockingIOError:
+            return
+        reply = parse_reply(memoryview(data))
+        if reply is None:
+            continue
+        waiter = pending.get(reply[0])
+        if waiter is None:
+            continue
+        future, message_types = waiter
+        if reply[2].get("message-type") not in message_types:
+            # e.g. a second server's OFFER while waiting for the ACK; keep
+            # waiting for the expected reply.
+            continue
+        del pending[reply[0]]
+        if not future.done():
+            future.set_result(reply)
+
+
+def _latency_bucket(nanoseconds: int) -> int:
+    shift = max(nanoseconds.bit_length() - 5, 0)
+    return min((shift << 4) + (nanoseconds >> shift), _LATENCY_BUCKETS - 1)
+
+
+def _latency_bucket_upper(bucket: int) -> int:
+    if bucket < 32:
+        return bucket
+    shift = (bucket >> 4) - 1
+    return ((bucket - (shift << 4) + 1) << shift) - 1
 
 
 def _iter_mac_addresses(
     count: int,
     mac_prefix: Optional[str],
     random_seed: Optional[int],
-) -> Generator[str, None, None]:
+) -> Iterator[str]:
     base_bytes = _parse_mac_prefix(mac_prefix) if mac_prefix else [0x02]
     if len(base_bytes) > 6:
         raise ValueError("MAC prefix may contain at most 6 octets.")
@@ -139,10 +426,13 @@ def _iter_mac_addresses(
         rng = random.Random(random_seed)
         start_offset = rng.randrange(0, available - count + 1)
 
-    base_value = _mac_bytes_to_int(base_bytes) << (remaining_octets * 8)
-    for offset in range(count):
-        mac_value = base_value + start_offset + offset
-        yield _mac_int_to_str(mac_value)
+    first = (_mac_bytes_to_int(base_bytes) << (remaining_octets * 8)) + start_offset
+    # Validation above runs eagerly; the addresses themselves are produced
+    # lazily so memory stays constant however many clients are simulated.
+    return (
+        mac_value.to_bytes(6, "big").hex(":")
+        for mac_value in range(first, first + count)
+    )
 
 
 def _parse_mac_prefix(prefix: Optional[str]) -> List[int]:
@@ -169,8 +459,3 @@ def _mac_bytes_to_int(bytes_: Sequence[int]) -> int:
     for byte in bytes_:
         value = (value << 8) | byte
     return value
-
-
-def _mac_int_to_str(value: int) -> str:
-    octets = [(value >> (8 * shift)) & 0xFF for shift in reversed(range(6))]
-    return ":".join(f"{octet:02x}" for octet in octets)
@@ -19,7 +19,7 @@ def main(argv: Optional[list[str]] = None) -> int:
         "--timeout",
         type=float,
         default=5.0,
-        help="seconds to wait for each DHCP response (default: 5)",
+        help="initial response timeout in seconds, doubled per retry (default: 5)",
     )
     parser.add_argument(
         "--retries",
@@ -27,6 +27,20 @@ def main(argv: Optional[list[str]] = None) -> int:
         default=3,
         help="number of handshake retries before failing (default: 3)",
     )
+    parser.add_argument(
+        "--transport",
+        choices=("packet", "udp"),
+        default="packet",
+        help="send raw Ethernet frames or kernel-built UDP datagrams "
+        "(single-client mode only, default: packet)",
+    )
+    parser.add_argument(
+        "--backend",
+        choices=("scapy", "raw"),
+        default="scapy",
+        help="build frames from Scapy templates or with plain struct packing "
+        "(default: scapy)",
+    )
     parser.add_argument(
         "--clients",
         type=int,
@@ -73,11 +87,16 @@ def main(argv: Optional[list[str]] = None) -> int:
                 timeout=args.timeout,
                 retries=args.retries,
                 client_mac=args.client_mac,
+                transport=args.transport,
+                include_raw_options=True,
+                backend=args.backend,
             )
             _print_lease(lease)
         else:
             if args.client_mac:
                 parser.error("--client-mac may only be used when --clients=1.")
+            if args.transport != "packet":
+                parser.error("--transport may only be used when --clients=1.")
             result = simulate_dhcp_clients(
                 count=args.clients,
                 concurrency=args.concurrency,
@@ -86,6 +105,7 @@ def main(argv: Optional[list[str]] = None) -> int:
                 retries=args.retries,
                 mac_prefix=args.mac_prefix,
                 random_seed=args.seed,
+                backend=args.backend,
             )
             _print_simulation(result)
     except PermissionError as exc:
@@ -122,6 +142,14 @@ def _print_simulation(result: SimulationResult) -> None:
     print(f"Simulated DHCP clients: {result.total}")
     print(f"Successful handshakes: {result.succeeded}")
     print(f"Failed handshakes: {result.failed}")
+    if result.succeeded:
+        p50, p95, p99, p999 = (
+            value / 1e6 for value in result.latency_percentiles((50, 95, 99, 99.9))
+        )
+        print(
+            f"Latency (ms): P50 {p50:.1f}, P95 {p95:.1f}, "
+            f"P99 {p99:.1f}, P99.9 {p999:.1f}"
+        )
 
     sample_successes = 5
     sample_failures = 10
@@ -131,7 +159,7 @@ def _print_simulation(result: SimulationResult) -> None:
         for mac, lease in result.successes[:sample_successes]:
             server = lease.server_id or "n/a"
             print(f"  {mac} -> {lease.assigned_ip} (server {server})")
-        remaining = len(result.successes) - sample_successes
+        remaining = result.succeeded - sample_successes
         if remaining > 0:
             print(f"  ... {remaining} more successful leases")
 
@@ -139,7 +167,7 @@ def _print_simulation(result: SimulationResult) -> None:
         print("Failures:")
         for mac, error in result.failures[:sample_failures]:
             print(f"  {mac}: {error}")
-        remaining = len(result.failures) - sample_failures
+        remaining = result.failed - sample_failures
         if remaining > 0:
             print(f"  ... {remaining} more failures")
 